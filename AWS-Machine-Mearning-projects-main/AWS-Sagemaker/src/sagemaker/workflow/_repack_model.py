@@ -14,11 +14,23 @@
 from __future__ import absolute_import
 
 import argparse
+import contextlib
+import errno
+import io
 import logging
+import mmap
 import os
 import shutil
+import stat
 import tarfile
 import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    # ISA-L decompresses gzip several times faster than zlib, when it is installed
+    from isal import igzip as _gzip
+except ImportError:
+    import gzip as _gzip
 
 # Repack Model
 # The following script is run via a training job which takes an existing model and a custom
@@ -27,20 +39,73 @@ import tempfile
 # is unpacked for inference, the custom entry point will be used.
 # Reference: https://docs.aws.amazon.com/sagemaker/latest/dg/amazon-sagemaker-toolkits.html
 
-from os.path import abspath, realpath, dirname, normpath, join as joinpath
+from os.path import realpath, dirname, join as joinpath
 
 logger = logging.getLogger(__name__)
 
+# Regular files up to this size are read from the archive and written with a single syscall.
+# Larger files are written in chunks of this size to bound the memory used per member.
+_MAX_WRITE_SIZE = 64 * 1024 * 1024
+# The model archive is read through a buffer of this size to reduce the number of read syscalls
+# made while decompressing it.
+_READ_BUFFER_SIZE = 4 * 1024 * 1024
+# The temporary directory is placed on this tmpfs when it has enough free space
+_TMPFS_DIR = "/dev/shm"
+# The gzip trailer stores the uncompressed size modulo this value
+_GZIP_SIZE_MODULUS = 2**32
+# Whether tarfile can filter members itself (Python 3.12+ and security backports)
+_HAS_DATA_FILTER = hasattr(tarfile, "data_filter")
+# The link member types checked by _get_safe_members, with their names used in log messages
+_LINK_TYPES = {tarfile.SYMTYPE: "Symlink", tarfile.LNKTYPE: "Hard link"}
+
 
 def _get_resolved_path(path):
     """Return the normalized absolute path of a given path.
 
-    abspath - returns the absolute path without resolving symlinks
-    realpath - resolves the symlinks and gets the actual path
-    normpath - normalizes paths (e.g. remove redudant separators)
-    and handles platform-specific differences
+    realpath makes the path absolute, resolves the symlinks and normalizes the result,
+    so no separate abspath or normpath call is needed.
+    """
+    return realpath(path)
+
+
+def _is_plain_relative_path(path):
+    """Checks if a path is lexically confined to the directory it is relative to.
+
+    The path must be relative, must not contain any ".." component and must not contain
+    a null byte. This is a string check only: symlinks in the path are not resolved.
+
+    Args:
+        path (str): The file path.
+
+    Returns:
+        bool: True if the path is a plain relative path, False otherwise.
     """
-    return normpath(realpath(abspath(path)))
+    return not path.startswith("/") and ".." not in path.split("/") and "\0" not in path
+
+
+def _make_bad_path_check(base):
+    """Return a function that checks if a path is not rooted under the given base directory.
+
+    The returned function is specialized to the base directory: the prefix it compares
+    against is computed once, and the functions it calls are bound as local names, so that
+    checking every member of a large archive does not repeat this work.
+
+    Args:
+        base (str): The resolved base directory.
+
+    Returns:
+        function: A function that takes a file path and returns True if the joined path
+            (base directory + file path) is not rooted under the base directory.
+    """
+    base_prefix = base.rstrip(os.sep) + os.sep
+
+    def is_bad_path(path, _realpath=realpath, _joinpath=joinpath):
+        # joinpath will ignore base if path is absolute. The joined path is already absolute,
+        # so realpath is enough to resolve it
+        resolved = _realpath(_joinpath(base, path))
+        return resolved != base and not resolved.startswith(base_prefix)
+
+    return is_bad_path
 
 
 def _is_bad_path(path, base):
@@ -56,8 +121,41 @@ def _is_bad_path(path, base):
     Returns:
         bool: True if the path is not rooted under the base directory, False otherwise.
     """
-    # joinpath will ignore base if path is absolute
-    return not _get_resolved_path(joinpath(base, path)).startswith(base)
+    return _make_bad_path_check(base)(path)
+
+
+def _has_bad_symlink_component(path, base):
+    """Checks if a component of the joined path (base directory + file path) is an existing
+    symlink whose target is not rooted under the base directory.
+
+    The components are inspected from left to right with lstat, and each symlink found is
+    resolved before the next component is inspected, so that a symlink extracted by an earlier
+    member cannot be used to escape the base directory.
+
+    Args:
+        path (str): The file path.
+        base (str): The base directory.
+
+    Returns:
+        bool: True if a component is a symlink that leaves the base directory, False otherwise.
+    """
+    base_prefix = base.rstrip(os.sep) + os.sep
+    current = base
+    for component in path.split(os.sep):
+        if component in ("", "."):
+            continue
+        current = joinpath(current, component)
+        try:
+            mode = os.lstat(current).st_mode
+        except OSError:
+            # nothing below a missing component exists yet
+            return False
+        if stat.S_ISLNK(mode):
+            # continue from the resolved location, so that chained symlinks are followed
+            current = realpath(current)
+            if current != base and not current.startswith(base_prefix):
+                return True
+    return False
 
 
 def _is_bad_link(info, base):
@@ -72,58 +170,523 @@ def _is_bad_link(info, base):
     Returns:
         bool: True if the link is not rooted under the base directory, False otherwise.
     """
+    if _has_bad_symlink_component(info.name, base):
+        return True
     # Links are interpreted relative to the directory containing the link
-    tip = _get_resolved_path(joinpath(base, dirname(info.name)))
+    tip = realpath(joinpath(base, dirname(info.name)))
     return _is_bad_path(info.linkname, base=tip)
 
 
-def _get_safe_members(members):
+def _contains_symlink(path):
+    """Checks if a directory tree contains a symlink.
+
+    Args:
+        path (str): The directory.
+
+    Returns:
+        bool: True if a symlink is found under the directory, False otherwise
+            (including when the directory does not exist).
+    """
+    directories = [path]
+    while directories:
+        try:
+            entries = os.scandir(directories.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_symlink():
+                    return True
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+    return False
+
+
+def _get_safe_members(members, base=None):
     """A generator that yields members that are safe to extract.
 
-    It filters out bad paths and bad links.
+    It filters out bad paths and bad links. The paths of the members are resolved with realpath
+    unless the base directory contained no symlink at the start and no symlink member has been
+    extracted yet, in which case a plain relative path cannot traverse a symlink.
 
     Args:
         members (list): A list of members to check.
+        base (str): The resolved directory the members are extracted to
+            (default: the current working directory).
 
     Yields:
         tarfile.TarInfo: The tar file info.
     """
-    base = _get_resolved_path(".")
+    if base is None:
+        base = _get_resolved_path(".")
+    is_bad_path = _make_bad_path_check(base)
+    # until a symlink exists in base, a plain relative path can only resolve under base,
+    # so resolving it with realpath (one lstat per component) can be skipped
+    symlink_extracted = _contains_symlink(base)
 
     for file_info in members:
-        if _is_bad_path(file_info.name, base):
+        must_resolve = symlink_extracted or not _is_plain_relative_path(file_info.name)
+        if must_resolve and is_bad_path(file_info.name):
             logger.error("%s is blocked (illegal path)", file_info.name)
-        elif file_info.issym() and _is_bad_link(file_info, base):
-            logger.error("%s is blocked: Symlink to %s", file_info.name, file_info.linkname)
-        elif file_info.islnk() and _is_bad_link(file_info, base):
-            logger.error("%s is blocked: Hard link to %s", file_info.name, file_info.linkname)
+        elif file_info.type in _LINK_TYPES and _is_bad_link(file_info, base):
+            logger.error(
+                "%s is blocked: %s to %s",
+                file_info.name,
+                _LINK_TYPES[file_info.type],
+                file_info.linkname,
+            )
         else:
+            symlink_extracted = symlink_extracted or file_info.type == tarfile.SYMTYPE
             yield file_info
 
 
-def custom_extractall_tarfile(tar, extract_path):
+def _iter_members(tar):
+    """A generator that yields the members of a tarfile without keeping them in tar.members.
+
+    The tarfile keeps every member it has read in tar.members, so that list is cleared after
+    each member to avoid holding the whole index of large archives in memory.
+    If the members were already loaded, e.g. by TarFile.getmembers(), they are yielded from
+    tar.members, which is left as is.
+
+    Args:
+        tar (tarfile.TarFile): The opened tarfile object.
+
+    Yields:
+        tarfile.TarInfo: The tar file info.
+    """
+    file_info = tar.next()
+    if file_info is None:
+        yield from list(tar.members)
+        return
+    while file_info is not None:
+        yield file_info
+        tar.members.clear()
+        file_info = tar.next()
+
+
+def _filtered_members(tar, extract_path):
+    """A generator that yields the members of a tarfile that are safe to extract.
+
+    If the tarfile module provides data_filter, it is applied to every member and the
+    filtered tar file info is yielded. Otherwise, the _get_safe_members function is used.
+
+    Args:
+        tar (tarfile.TarFile): The opened tarfile object.
+        extract_path (str): The path the contents of the tarfile are extracted to.
+
+    Yields:
+        tarfile.TarInfo: The tar file info.
+    """
+    if _HAS_DATA_FILTER:
+        return (tarfile.data_filter(file_info, extract_path) for file_info in _iter_members(tar))
+    return _get_safe_members(_iter_members(tar), base=_get_resolved_path(extract_path))
+
+
+def _makedirs_once(path, created_dirs):
+    """Create a directory (and its parents) unless it was already created during this extraction.
+
+    Args:
+        path (str): The directory to create.
+        created_dirs (set): The directories already created during this extraction.
+    """
+    if path not in created_dirs:
+        os.makedirs(path, exist_ok=True)
+        created_dirs.add(path)
+
+
+def _write_all(fd, data):
+    """Write all of the given data to a file descriptor.
+
+    Args:
+        fd (int): The file descriptor to write to.
+        data (bytes): The data to write.
+    """
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+def _open_member_file(file_info, path):
+    """Create (or truncate) the file a regular tar member is extracted to.
+
+    The mode of the member is set explicitly, as TarFile.chmod does, so that it is neither
+    masked by the umask nor left unchanged on an existing file.
+
+    Args:
+        file_info (tarfile.TarInfo): The tar file info of a regular file.
+        path (str): The path of the file to create.
+
+    Returns:
+        int: The file descriptor of the created file, opened for writing.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, file_info.mode)
+    try:
+        os.fchmod(fd, file_info.mode)
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _write_member(tar, file_info, path):
+    """Write the contents of a regular tar member to the given path.
+
+    The contents are read from the archive and written to the file in a single call unless the
+    member is larger than _MAX_WRITE_SIZE.
+
+    Args:
+        tar (tarfile.TarFile): The opened tarfile object.
+        file_info (tarfile.TarInfo): The tar file info of a regular file.
+        path (str): The path of the file to write.
+    """
+    fd = _open_member_file(file_info, path)
+    try:
+        with tar.extractfile(file_info) as src:
+            remaining = file_info.size
+            while remaining > 0:
+                data = src.read(min(remaining, _MAX_WRITE_SIZE))
+                if not data:
+                    raise tarfile.ReadError(f"unexpected end of data in {file_info.name}")
+                remaining -= len(data)
+                _write_all(fd, data)
+    finally:
+        os.close(fd)
+
+
+def _copy_member_data(archive, file_info, path):
+    """Extract a regular tar member from a memory-mapped archive to the given path.
+
+    The file is created and its contents are written straight from the mapping, without being
+    copied into an intermediate buffer, so this can run in worker threads that share the mapping.
+
+    Args:
+        archive (mmap.mmap): The memory-mapped uncompressed tar archive.
+        file_info (tarfile.TarInfo): The tar file info of a regular file.
+        path (str): The path of the file to create.
+    """
+    start = file_info.offset_data
+    with memoryview(archive)[start : start + file_info.size] as data:
+        if len(data) < file_info.size:
+            raise tarfile.ReadError(f"unexpected end of data in {file_info.name}")
+        fd = _open_member_file(file_info, path)
+        try:
+            _write_all(fd, data)
+        finally:
+            os.close(fd)
+
+
+def _file_keys(path, resolved_dirs):
+    """Return the keys that identify the file at a path among the pending extractions.
+
+    The file is identified by its path with the symlinks resolved, so that paths through
+    symlinked directories match, and, if it already exists, by its inode, so that its hard
+    links match. The parent directories are resolved once and cached in resolved_dirs.
+
+    Args:
+        path (str): The path about to be written or linked to.
+        resolved_dirs (dict): The resolved paths of the parent directories seen so far.
+
+    Returns:
+        list: The keys of the file.
+    """
+    parent = dirname(path)
+    resolved_parent = resolved_dirs.get(parent)
+    if resolved_parent is None:
+        resolved_parent = resolved_dirs[parent] = realpath(parent)
+    key = joinpath(resolved_parent, os.path.basename(path))
+    try:
+        file_stat = os.lstat(path)
+        if stat.S_ISLNK(file_stat.st_mode):
+            # regular files are written through an existing symlink
+            key = realpath(path)
+            file_stat = os.stat(path)
+    except OSError:
+        return [key]
+    return [key, (file_stat.st_dev, file_stat.st_ino)]
+
+
+def _wait_for_file(pending, keys):
+    """Wait until the pending extraction of a file, if any, is done.
+
+    Args:
+        pending (dict): The futures of the files being extracted, by file key.
+        keys (list): The keys of the file about to be written or linked to.
+    """
+    for key in keys:
+        future = pending.pop(key, None)
+        if future is not None:
+            future.result()
+
+
+def _wait_for_any(pending):
+    """Wait until at least one pending extraction is done and forget the finished ones.
+
+    Args:
+        pending (dict): The futures of the files being extracted, by file key.
+    """
+    done, _ = wait(set(pending.values()), return_when=FIRST_COMPLETED)
+    for key, future in list(pending.items()):
+        if future in done:
+            del pending[key]
+            future.result()
+
+
+def _extract_hardlink(file_info, base, path):
+    """Extract a hard link member by linking to the previously extracted target.
+
+    Unlike TarFile.extract, the target is never looked up in the members of the tarfile,
+    which are not kept during the extraction.
+
+    Args:
+        file_info (tarfile.TarInfo): The tar file info of a hard link.
+        base (str): The path the contents of the tarfile are extracted to.
+        path (str): The path of the link to create.
+    """
+    target = joinpath(base, file_info.linkname)
+    if _is_bad_path(file_info.linkname, _get_resolved_path(base)):
+        logger.error("%s is blocked: Hard link to %s", file_info.name, file_info.linkname)
+        return
+    if not os.path.isfile(target):
+        logger.error("%s is skipped: Hard link target %s is missing", file_info.name, target)
+        return
+    if os.path.lexists(path):
+        os.unlink(path)
+    try:
+        os.link(target, path)
+    except OSError:
+        # e.g. the file system does not support hard links
+        shutil.copy2(target, path)
+
+
+def _extract_members_bulk(tar, base, concurrency=1):
+    """Extract the safe members of a tarfile, writing regular files directly.
+
+    Regular files are written without going through TarFile.extract, with one write call per
+    file and without setting their modification time, and the parent directories are created
+    once per extraction instead of being checked for every member.
+    Hard links are made to the previously extracted targets, and other members (symlinks,
+    special files) are delegated to TarFile.extract. As with
+    TarFile.extractall, directory attributes are set last so that restrictive permissions
+    do not prevent their contents from being written.
+
+    With a concurrency greater than 1, the contents of regular files are written by a pool of
+    worker threads, which keeps many file operations in flight on network file systems.
+    At most twice as many files as threads are in flight at once, and a member that replaces
+    or links to a file still being written, under any of its names, waits for it first.
+    This requires the tarfile to be opened from an uncompressed archive on disk, which the
+    workers read through a shared read-only memory mapping.
+
+    Args:
+        tar (tarfile.TarFile): The opened tarfile object.
+        base (str): The path to extract the contents of the tarfile.
+        concurrency (int): The number of threads writing regular files (default: 1).
+
+    Raises:
+        ValueError: If concurrency is greater than 1 and the tarfile is not opened from
+            an uncompressed archive on disk.
+    """
+    if concurrency > 1 and not isinstance(tar.fileobj, (io.BufferedReader, io.FileIO)):
+        raise ValueError(
+            "Concurrent extraction requires a tarfile opened from an uncompressed archive."
+        )
+
+    # the members are already filtered, so TarFile.extract must not filter them again
+    extract_kwargs = {"filter": "fully_trusted"} if _HAS_DATA_FILTER else {}
+    created_dirs = set()
+    directories = []
+
+    with contextlib.ExitStack() as stack:
+        archive = None
+        if concurrency > 1:
+            # the workers share the page cache of the archive instead of reading copies of it
+            archive = stack.enter_context(
+                mmap.mmap(tar.fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=concurrency))
+        # the files being extracted by the workers, bounded so that neither the open files
+        # nor the tar file infos of the members accumulate on large archives
+        pending = {}
+        max_pending = 2 * concurrency
+        resolved_dirs = {}
+        for file_info in _filtered_members(tar, base):
+            path = joinpath(base, file_info.name)
+            keys = _file_keys(path, resolved_dirs) if archive is not None else ()
+            # a later member replaces a file, under any of its names, only once it is written
+            _wait_for_file(pending, keys)
+            if file_info.isreg():
+                _makedirs_once(dirname(path), created_dirs)
+                if archive is None or file_info.issparse():
+                    _write_member(tar, file_info, path)
+                else:
+                    if len(pending) >= max_pending:
+                        _wait_for_any(pending)
+                    future = executor.submit(_copy_member_data, archive, file_info, path)
+                    for key in keys:
+                        pending[key] = future
+            elif file_info.isdir():
+                _makedirs_once(path, created_dirs)
+                directories.append(file_info)
+            elif file_info.islnk():
+                _makedirs_once(dirname(path), created_dirs)
+                if archive is not None:
+                    target = joinpath(base, file_info.linkname)
+                    _wait_for_file(pending, _file_keys(target, resolved_dirs))
+                _extract_hardlink(file_info, base, path)
+            else:
+                tar.extract(file_info, base, set_attrs=False, **extract_kwargs)
+                # a new symlink can change how the cached parent directories resolve
+                resolved_dirs.clear()
+
+        for future in set(pending.values()):
+            future.result()
+
+    # set the attributes of the deepest directories first
+    directories.sort(key=lambda file_info: file_info.name, reverse=True)
+    for file_info in directories:
+        path = joinpath(base, file_info.name)
+        try:
+            tar.utime(file_info, path)
+            tar.chmod(file_info, path)
+        except tarfile.ExtractError as e:
+            # non-fatal at the default errorlevel, as in TarFile.extractall
+            if tar.errorlevel > 1:
+                raise
+            logger.warning("tarfile: %s", e)
+
+
+def custom_extractall_tarfile(tar, extract_path, concurrency=1):
     """Extract a tarfile, optionally using data_filter if available.
 
     # TODO: The function and it's usages can be deprecated once SageMaker Python SDK
     is upgraded to use Python 3.12+
 
-    If the tarfile has a data_filter attribute, it will be used to extract the contents of the file.
-    Otherwise, the _get_safe_members function will be used to filter bad paths and bad links.
+    If the tarfile has a data_filter attribute, it will be used to filter the members of the file.
+    Otherwise, the _get_safe_members function will be used to filter bad paths and bad links,
+    which also checks the symlinks already present in extract_path.
 
     Args:
         tar (tarfile.TarFile): The opened tarfile object.
         extract_path (str): The path to extract the contents of the tarfile.
+        concurrency (int): The number of threads writing regular files (default: 1).
+            Values greater than 1 require a tarfile opened from an uncompressed archive on disk.
+
+    The members are not kept in memory, so TarFile.getmembers() returns an empty list after
+    the extraction, unless the members were already loaded before it.
 
     Returns:
         None
     """
-    if hasattr(tarfile, "data_filter"):
-        tar.extractall(path=extract_path, filter="data")
-    else:
-        tar.extractall(path=extract_path, members=_get_safe_members(tar))
+    _extract_members_bulk(tar, extract_path, concurrency=concurrency)
+
+
+def _uncompressed_size(model_path):
+    """Estimate the size of a gzip-compressed archive once decompressed.
 
+    The size is read from the gzip trailer, which stores it modulo 4 GiB, and is taken to be
+    the smallest such size that is not below the compressed size. The estimate is too low when
+    the archive grows by 4 GiB or more once decompressed.
+
+    Args:
+        model_path (str): The path of the model TAR archive.
+
+    Returns:
+        int: The estimated number of bytes of the uncompressed archive.
+    """
+    with open(model_path, "rb") as f:
+        compressed_size = f.seek(0, os.SEEK_END)
+        if compressed_size < 4:
+            return compressed_size
+        f.seek(-4, os.SEEK_END)
+        size = int.from_bytes(f.read(4), "little")
+    while size < compressed_size:
+        size += _GZIP_SIZE_MODULUS
+    return size
+
+
+def _decompress_model_archive(model_path, tmp):
+    """Decompress a gzip-compressed model archive to an uncompressed archive.
+
+    Args:
+        model_path (str): The path of the model TAR archive.
+        tmp (str): The directory to write the uncompressed archive to.
 
-def repack(inference_script, model_archive, dependencies=None, source_dir=None):  # pragma: no cover
+    Returns:
+        str: The path of the uncompressed archive.
+    """
+    archive_path = os.path.join(tmp, "archive.tar")
+    with open(model_path, "rb", buffering=_READ_BUFFER_SIZE) as buf, _gzip.GzipFile(
+        fileobj=buf, mode="rb"
+    ) as gz, open(archive_path, "wb") as archive:
+        shutil.copyfileobj(gz, archive, _READ_BUFFER_SIZE)
+    return archive_path
+
+
+def _extract_model_archive(model_path, extract_path, concurrency=1):
+    """Extract a gzip-compressed model archive.
+
+    The archive is decompressed with isal.igzip if it is installed, and with gzip otherwise,
+    and its members are read as a stream.
+    With a concurrency greater than 1, the archive is first decompressed to an uncompressed
+    archive in a temporary directory, in memory if there is enough room for it, from which the
+    members are written concurrently. If the size of the uncompressed archive was
+    underestimated and the tmpfs runs out of space, the default temporary directory is used.
+
+    Args:
+        model_path (str): The path of the model TAR archive.
+        extract_path (str): The path to extract the contents of the model archive.
+        concurrency (int): The number of threads writing regular files (default: 1).
+    """
+    if concurrency <= 1:
+        with open(model_path, "rb", buffering=_READ_BUFFER_SIZE) as buf, _gzip.GzipFile(
+            fileobj=buf, mode="rb"
+        ) as gz, tarfile.open(fileobj=gz, mode="r|", bufsize=_READ_BUFFER_SIZE) as tf:
+            custom_extractall_tarfile(tf, extract_path)
+        return
+
+    tmpfs_dir = _pick_tmpdir(_uncompressed_size(model_path))
+    with contextlib.ExitStack() as stack:
+        tmp = stack.enter_context(tempfile.TemporaryDirectory(dir=tmpfs_dir))
+        try:
+            archive_path = _decompress_model_archive(model_path, tmp)
+        except OSError as e:
+            if tmpfs_dir is None or e.errno != errno.ENOSPC:
+                raise
+            logger.warning(
+                "%s is full, decompressing to the default temporary directory", tmpfs_dir
+            )
+            stack.close()
+            tmp = stack.enter_context(tempfile.TemporaryDirectory())
+            archive_path = _decompress_model_archive(model_path, tmp)
+
+        with tarfile.open(name=archive_path, mode="r:") as tf:
+            custom_extractall_tarfile(tf, extract_path, concurrency=concurrency)
+
+
+def _pick_tmpdir(required_bytes):
+    """Return the tmpfs directory if it has room for the given number of bytes.
+
+    Writing to tmpfs avoids persisting data that is only needed during the repack.
+    Twice the required space must be available, so that the repack does not exhaust the
+    memory backing the tmpfs.
+
+    Args:
+        required_bytes (int): The estimated number of bytes written to the temporary directory.
+
+    Returns:
+        str: The tmpfs directory, or None to use the default temporary directory.
+    """
+    try:
+        fs_stat = os.statvfs(_TMPFS_DIR)
+    except OSError:
+        return None
+    if fs_stat.f_bavail * fs_stat.f_frsize >= required_bytes * 2:
+        return _TMPFS_DIR
+    return None
+
+
+def repack(
+    inference_script, model_archive, dependencies=None, source_dir=None, extract_concurrency=1
+):  # pragma: no cover
     """Repack custom dependencies and code into an existing model TAR archive
 
     Args:
@@ -131,57 +694,51 @@ def repack(inference_script, model_archive, dependencies=None, source_dir=None):
         model_archive (str): The name or path (e.g. s3 uri) of the model TAR archive.
         dependencies (str): A space-delimited string of paths to custom dependencies.
         source_dir (str): The path to a custom source directory.
+        extract_concurrency (int): The number of threads writing the files of the model archive
+            (default: 1). Higher values help when /opt/ml/model is on a network file system.
     """
 
     # the data directory contains a model archive generated by a previous training job
     data_directory = "/opt/ml/input/data/training"
     model_path = os.path.join(data_directory, model_archive.split("/")[-1])
 
-    # create a temporary directory
-    with tempfile.TemporaryDirectory() as tmp:
-        local_path = os.path.join(tmp, "local.tar.gz")
-        # copy the previous training job's model archive to the temporary directory
-        shutil.copy2(model_path, local_path)
-        src_dir = os.path.join(tmp, "src")
-        # create the "code" directory which will contain the inference script
-        code_dir = os.path.join(src_dir, "code")
-        os.makedirs(code_dir)
-        # extract the contents of the previous training job's model archive to the "src"
-        # directory of this training job
-        with tarfile.open(name=local_path, mode="r:gz") as tf:
-            custom_extractall_tarfile(tf, src_dir)
-
-        if source_dir:
-            # copy /opt/ml/code to code/
-            if os.path.exists(code_dir):
-                shutil.rmtree(code_dir)
-            shutil.copytree("/opt/ml/code", code_dir)
-        else:
-            # copy the custom inference script to code/
-            entry_point = os.path.join("/opt/ml/code", inference_script)
-            shutil.copy2(entry_point, os.path.join(code_dir, inference_script))
-
-        # copy any dependencies to code/lib/
-        if dependencies:
-            for dependency in dependencies.split(" "):
-                actual_dependency_path = os.path.join("/opt/ml/code", dependency)
-                lib_dir = os.path.join(code_dir, "lib")
-                if not os.path.exists(lib_dir):
-                    os.mkdir(lib_dir)
-                if os.path.isfile(actual_dependency_path):
-                    shutil.copy2(actual_dependency_path, lib_dir)
-                else:
-                    if os.path.exists(lib_dir):
-                        shutil.rmtree(lib_dir)
-                    # a directory is in the dependencies. we have to copy
-                    # all of /opt/ml/code into the lib dir because the original directory
-                    # was flattened by the SDK training job upload..
-                    shutil.copytree("/opt/ml/code", lib_dir)
-                    break
-
-        # copy the "src" dir, which includes the previous training job's model and the
-        # custom inference script, to the output of this training job
-        shutil.copytree(src_dir, "/opt/ml/model", dirs_exist_ok=True)
+    # the model is repacked in place in the output of this training job
+    model_dir = "/opt/ml/model"
+    # the code directory contains the inference script, source dir and dependencies
+    code_root = "/opt/ml/code"
+
+    # create the "code" directory which will contain the inference script
+    code_dir = os.path.join(model_dir, "code")
+    os.makedirs(code_dir, exist_ok=True)
+    # extract the contents of the previous training job's model archive directly to the
+    # output of this training job
+    _extract_model_archive(model_path, model_dir, concurrency=extract_concurrency)
+
+    if source_dir:
+        # copy /opt/ml/code to code/
+        shutil.rmtree(code_dir, ignore_errors=True)
+        shutil.copytree(code_root, code_dir)
+    else:
+        # copy the custom inference script to code/
+        entry_point = os.path.join(code_root, inference_script)
+        shutil.copy2(entry_point, os.path.join(code_dir, inference_script))
+
+    # copy any dependencies to code/lib/
+    if dependencies:
+        lib_dir = os.path.join(code_dir, "lib")
+        os.makedirs(lib_dir, exist_ok=True)
+        for dependency in dependencies.split():
+            # SageMaker training containers always run on Linux
+            actual_dependency_path = f"{code_root}/{dependency}"
+            if os.path.isfile(actual_dependency_path):
+                shutil.copy2(actual_dependency_path, lib_dir)
+            else:
+                shutil.rmtree(lib_dir, ignore_errors=True)
+                # a directory is in the dependencies. we have to copy
+                # all of /opt/ml/code into the lib dir because the original directory
+                # was flattened by the SDK training job upload..
+                shutil.copytree(code_root, lib_dir)
+                break
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -190,10 +747,12 @@ if __name__ == "__main__":  # pragma: no cover
     parser.add_argument("--dependencies", type=str, default=None)
     parser.add_argument("--source_dir", type=str, default=None)
     parser.add_argument("--model_archive", type=str, default="model.tar.gz")
+    parser.add_argument("--extract_concurrency", type=int, default=1)
     args, extra = parser.parse_known_args()
     repack(
         inference_script=args.inference_script,
         dependencies=args.dependencies,
         source_dir=args.source_dir,
         model_archive=args.model_archive,
+        extract_concurrency=args.extract_concurrency,
     )
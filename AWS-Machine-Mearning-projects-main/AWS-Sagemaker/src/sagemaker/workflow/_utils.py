@@ -50,6 +50,8 @@ FRAMEWORK_VERSION = "1.2-1"
 INSTANCE_TYPE = "ml.m5.large"
 REPACK_SCRIPT = "_repack_model.py"
 REPACK_SCRIPT_LAUNCHER = "_repack_script_launcher.sh"
+# the extract_concurrency hyperparameter is not set by _RepackModelStep, so concurrent
+# extraction is opt-in, e.g. with step.estimator.set_hyperparameters(extract_concurrency=8)
 LAUNCH_REPACK_SCRIPT_CMD = """
 #!/bin/bash
 
@@ -57,12 +59,14 @@ var_dependencies="${SM_HP_DEPENDENCIES}"
 var_inference_script="${SM_HP_INFERENCE_SCRIPT}"
 var_model_archive="${SM_HP_MODEL_ARCHIVE}"
 var_source_dir="${SM_HP_SOURCE_DIR}"
+var_extract_concurrency="${SM_HP_EXTRACT_CONCURRENCY:-1}"
 
 python _repack_model.py \
 --dependencies "${var_dependencies}" \
 --inference_script "${var_inference_script}" \
 --model_archive "${var_model_archive}" \
---source_dir "${var_source_dir}"
+--source_dir "${var_source_dir}" \
+--extract_concurrency "${var_extract_concurrency}"
 """
 
 
@@ -14,6 +14,9 @@ from __future__ import absolute_import
 from sagemaker.workflow import _repack_model
 
 from pathlib import Path
+import errno
+import gzip
+import io
 import shutil
 import tarfile
 import os
@@ -159,6 +162,354 @@ def test_repack_with_source_dir_and_dependencies(tmp):
     assert os.path.exists(os.path.join("/opt/ml/model/code/some/dir", "a"))
 
 
+def test_custom_extractall_tarfile(tmp):
+    create_file_tree(os.path.join(tmp, "model"), ["model.pth", "code/inference.py"])
+    os.symlink("model.pth", os.path.join(tmp, "model", "latest.pth"))
+    model_tar_location = os.path.join(tmp, "model.tar.gz")
+    with tarfile.open(model_tar_location, mode="w:gz") as t:
+        t.add(os.path.join(tmp, "model"), arcname=".")
+
+    extract_path = os.path.join(tmp, "extracted")
+    with tarfile.open(model_tar_location, mode="r:gz") as t:
+        _repack_model.custom_extractall_tarfile(t, extract_path)
+        # the members are not kept in memory during the extraction
+        assert t.members == []
+        assert t.getmembers() == []
+
+    with open(os.path.join(extract_path, "model.pth")) as f:
+        assert f.read() == "model.pth"
+    with open(os.path.join(extract_path, "code", "inference.py")) as f:
+        assert f.read() == "code/inference.py"
+    assert os.readlink(os.path.join(extract_path, "latest.pth")) == "model.pth"
+
+
+def test_custom_extractall_tarfile_with_loaded_members(tmp):
+    files = ["model-%d.pth" % i for i in range(5)]
+    create_file_tree(os.path.join(tmp, "model"), files)
+    model_tar_location = os.path.join(tmp, "model.tar.gz")
+    with tarfile.open(model_tar_location, mode="w:gz") as t:
+        t.add(os.path.join(tmp, "model"), arcname=".")
+
+    extract_path = os.path.join(tmp, "extracted")
+    with tarfile.open(model_tar_location, mode="r:gz") as t:
+        names = t.getnames()
+        _repack_model.custom_extractall_tarfile(t, extract_path)
+        assert t.getnames() == names
+
+    for file in files:
+        with open(os.path.join(extract_path, file)) as f:
+            assert f.read() == file
+
+
+def test_custom_extractall_tarfile_sets_member_mode(tmp):
+    create_file_tree(os.path.join(tmp, "model"), ["serve.sh"])
+    os.chmod(os.path.join(tmp, "model", "serve.sh"), 0o755)
+    model_tar_location = os.path.join(tmp, "model.tar.gz")
+    with tarfile.open(model_tar_location, mode="w:gz") as t:
+        t.add(os.path.join(tmp, "model"), arcname=".")
+
+    extract_path = os.path.join(tmp, "extracted")
+    create_file_tree(extract_path, ["serve.sh"])
+    os.chmod(os.path.join(extract_path, "serve.sh"), 0o600)
+    umask = os.umask(0o077)
+    try:
+        with tarfile.open(model_tar_location, mode="r:gz") as t:
+            _repack_model.custom_extractall_tarfile(t, extract_path)
+    finally:
+        os.umask(umask)
+
+    assert os.stat(os.path.join(extract_path, "serve.sh")).st_mode & 0o777 == 0o755
+
+
+def test_custom_extractall_tarfile_ignores_directory_attribute_errors(tmp, monkeypatch):
+    create_file_tree(os.path.join(tmp, "model"), ["code/inference.py"])
+    model_tar_location = os.path.join(tmp, "model.tar.gz")
+    with tarfile.open(model_tar_location, mode="w:gz") as t:
+        t.add(os.path.join(tmp, "model"), arcname=".")
+
+    def utime(*args, **kwargs):
+        raise PermissionError("Operation not permitted")
+
+    extract_path = os.path.join(tmp, "extracted")
+    with tarfile.open(model_tar_location, mode="r:gz") as t:
+        monkeypatch.setattr(os, "utime", utime)
+        _repack_model.custom_extractall_tarfile(t, extract_path)
+        monkeypatch.undo()
+
+    with open(os.path.join(extract_path, "code", "inference.py")) as f:
+        assert f.read() == "code/inference.py"
+
+
+def test_custom_extractall_tarfile_concurrently(tmp):
+    files = ["model-%d.pth" % i for i in range(10)] + ["code/inference.py"]
+    create_file_tree(os.path.join(tmp, "model"), files)
+    os.link(os.path.join(tmp, "model", "model-0.pth"), os.path.join(tmp, "model", "hardlink.pth"))
+    model_tar_location = os.path.join(tmp, "model.tar")
+    with tarfile.open(model_tar_location, mode="w") as t:
+        t.add(os.path.join(tmp, "model"), arcname=".")
+
+    extract_path = os.path.join(tmp, "extracted")
+    with tarfile.open(model_tar_location, mode="r:") as t:
+        _repack_model.custom_extractall_tarfile(t, extract_path, concurrency=4)
+
+    for file in files:
+        with open(os.path.join(extract_path, file)) as f:
+            assert f.read() == file
+    with open(os.path.join(extract_path, "hardlink.pth")) as f:
+        assert f.read() == "model-0.pth"
+
+
+def test_custom_extractall_tarfile_concurrently_with_duplicate_names(tmp):
+    def add_file(t, name, data):
+        file_info = tarfile.TarInfo(name)
+        file_info.size = len(data)
+        t.addfile(file_info, io.BytesIO(data))
+
+    model_tar_location = os.path.join(tmp, "model.tar")
+    with tarfile.open(model_tar_location, mode="w") as t:
+        add_file(t, "model.bin", b"A" * 32 * 1024 * 1024)
+        add_file(t, "./model.bin", b"new")
+        link_info = tarfile.TarInfo("hardlink.bin")
+        link_info.type = tarfile.LNKTYPE
+        link_info.linkname = "model.bin"
+        t.addfile(link_info)
+        for i in range(20):
+            add_file(t, "model-%d.bin" % i, b"%d" % i)
+
+    extract_path = os.path.join(tmp, "extracted")
+    with tarfile.open(model_tar_location, mode="r:") as t:
+        _repack_model.custom_extractall_tarfile(t, extract_path, concurrency=2)
+
+    for name in ("model.bin", "hardlink.bin"):
+        with open(os.path.join(extract_path, name), "rb") as f:
+            assert f.read() == b"new"
+    for i in range(20):
+        with open(os.path.join(extract_path, "model-%d.bin" % i), "rb") as f:
+            assert f.read() == b"%d" % i
+
+
+def test_custom_extractall_tarfile_concurrently_through_links(tmp, monkeypatch):
+    def add_file(t, name, data):
+        file_info = tarfile.TarInfo(name)
+        file_info.size = len(data)
+        t.addfile(file_info, io.BytesIO(data))
+
+    def add_link(t, name, linkname, link_type):
+        link_info = tarfile.TarInfo(name)
+        link_info.type = link_type
+        link_info.linkname = linkname
+        t.addfile(link_info)
+
+    model_tar_location = os.path.join(tmp, "model.tar")
+    with tarfile.open(model_tar_location, mode="w") as t:
+        add_file(t, "sub/model.bin", b"A" * 32 * 1024 * 1024)
+        add_link(t, "alias", "sub", tarfile.SYMTYPE)
+        add_file(t, "alias/model.bin", b"new")
+        add_file(t, "model.bin", b"B")
+        add_link(t, "hardlink.bin", "model.bin", tarfile.LNKTYPE)
+        add_file(t, "model.bin", b"A" * 32 * 1024 * 1024)
+        add_file(t, "hardlink.bin", b"new")
+
+    write_all = _repack_model._write_all
+
+    def slow_write_all(fd, data):
+        # let a racing write of the same file finish first
+        if len(data) > 1024:
+            time.sleep(0.2)
+        write_all(fd, data)
+
+    monkeypatch.setattr(_repack_model, "_write_all", slow_write_all)
+    extract_path = os.path.join(tmp, "extracted")
+    with tarfile.open(model_tar_location, mode="r:") as t:
+        _repack_model.custom_extractall_tarfile(t, extract_path, concurrency=2)
+
+    for name in ("sub/model.bin", "model.bin", "hardlink.bin"):
+        with open(os.path.join(extract_path, name), "rb") as f:
+            assert f.read() == b"new"
+
+
+def test_extract_model_archive_concurrently_when_tmpfs_is_full(tmp, monkeypatch):
+    files = ["model-%d.pth" % i for i in range(10)]
+    create_file_tree(os.path.join(tmp, "model"), files)
+    model_tar_location = os.path.join(tmp, "model.tar.gz")
+    with tarfile.open(model_tar_location, mode="w:gz") as t:
+        t.add(os.path.join(tmp, "model"), arcname=".")
+
+    tmpfs_dir = os.path.join(tmp, "shm")
+    os.mkdir(tmpfs_dir)
+    decompress_model_archive = _repack_model._decompress_model_archive
+
+    def decompress_to_tmpdir(model_path, tmp_dir):
+        if tmp_dir.startswith(tmpfs_dir):
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return decompress_model_archive(model_path, tmp_dir)
+
+    monkeypatch.setattr(_repack_model, "_pick_tmpdir", lambda required_bytes: tmpfs_dir)
+    monkeypatch.setattr(_repack_model, "_decompress_model_archive", decompress_to_tmpdir)
+    extract_path = os.path.join(tmp, "extracted")
+    _repack_model._extract_model_archive(model_tar_location, extract_path, concurrency=4)
+
+    for file in files:
+        with open(os.path.join(extract_path, file)) as f:
+            assert f.read() == file
+    assert os.listdir(tmpfs_dir) == []
+
+
+def test_custom_extractall_tarfile_concurrently_requires_uncompressed_archive(tmp):
+    create_file_tree(os.path.join(tmp, "model"), ["model.pth"])
+    model_tar_location = os.path.join(tmp, "model.tar.gz")
+    with tarfile.open(model_tar_location, mode="w:gz") as t:
+        t.add(os.path.join(tmp, "model"), arcname=".")
+
+    with tarfile.open(model_tar_location, mode="r:gz") as t:
+        with pytest.raises(ValueError):
+            _repack_model.custom_extractall_tarfile(
+                t, os.path.join(tmp, "extracted"), concurrency=4
+            )
+
+
+@pytest.mark.parametrize(
+    "available_blocks, expected", [(2000, "/dev/shm"), (1999, None), (None, None)]
+)
+def test_pick_tmpdir(monkeypatch, available_blocks, expected):
+    def statvfs(path):
+        assert path == "/dev/shm"
+        if available_blocks is None:
+            raise FileNotFoundError(path)
+        return os.statvfs_result((4096, 1024, 4096, 4096, available_blocks, 0, 0, 0, 0, 255))
+
+    monkeypatch.setattr(os, "statvfs", statvfs)
+    assert _repack_model._pick_tmpdir(1000 * 1024) == expected
+
+
+def test_uncompressed_size(tmp):
+    create_file_tree(os.path.join(tmp, "model"), ["model-%d.pth" % i for i in range(10)])
+    model_tar_location = os.path.join(tmp, "model.tar.gz")
+    with tarfile.open(model_tar_location, mode="w:gz") as t:
+        t.add(os.path.join(tmp, "model"), arcname=".")
+
+    with gzip.open(model_tar_location, "rb") as f:
+        expected = len(f.read())
+    assert _repack_model._uncompressed_size(model_tar_location) == expected
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("model.pth", False),
+        ("code/../model.pth", False),
+        (".", False),
+        ("../model.pth", True),
+        ("../base-sibling/model.pth", True),
+        ("/model.pth", True),
+    ],
+)
+def test_is_bad_path(tmp, path, expected):
+    base = os.path.join(tmp, "base")
+    os.makedirs(base)
+    assert _repack_model._is_bad_path(path, base) == expected
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("model.pth", True),
+        ("code/./inference.py", True),
+        ("code/..inference.py", True),
+        ("code/../model.pth", False),
+        ("/model.pth", False),
+        ("model\0.pth", False),
+    ],
+)
+def test_is_plain_relative_path(path, expected):
+    assert _repack_model._is_plain_relative_path(path) == expected
+
+
+def test_is_bad_link_through_existing_symlink(tmp):
+    base = os.path.join(tmp, "base")
+    outside = os.path.join(tmp, "outside")
+    os.makedirs(base)
+    os.makedirs(outside)
+    os.symlink(outside, os.path.join(base, "escape"))
+    os.symlink("model", os.path.join(base, "inside"))
+
+    escaping_link = tarfile.TarInfo(name="escape/link")
+    escaping_link.type = tarfile.SYMTYPE
+    escaping_link.linkname = "model.pth"
+    assert _repack_model._is_bad_link(escaping_link, base)
+
+    inside_link = tarfile.TarInfo(name="inside/link")
+    inside_link.type = tarfile.SYMTYPE
+    inside_link.linkname = "model.pth"
+    assert not _repack_model._is_bad_link(inside_link, base)
+
+    # each symlink is relative to where the previous one resolved to
+    os.symlink(".", os.path.join(base, "p"))
+    os.symlink("../esc", os.path.join(base, "q"))
+    chained_link = tarfile.TarInfo(name="p/q/link")
+    chained_link.type = tarfile.SYMTYPE
+    chained_link.linkname = "model.pth"
+    assert _repack_model._is_bad_link(chained_link, base)
+
+
+def test_get_safe_members_after_symlink_member(tmp):
+    base = os.path.join(tmp, "base")
+    outside = os.path.join(tmp, "outside")
+    os.makedirs(base)
+    os.makedirs(outside)
+
+    link = tarfile.TarInfo(name="link")
+    link.type = tarfile.SYMTYPE
+    link.linkname = "model"
+    members = [link, tarfile.TarInfo(name="link/evil"), tarfile.TarInfo(name="model.pth")]
+
+    safe_members = []
+    for file_info in _repack_model._get_safe_members(members, base=base):
+        safe_members.append(file_info.name)
+        if file_info.issym():
+            # the symlink on disk is what later members are checked against
+            os.symlink(outside, os.path.join(base, file_info.name))
+    assert safe_members == ["link", "model.pth"]
+
+
+def test_get_safe_members_with_existing_symlink(tmp):
+    base = os.path.join(tmp, "base")
+    os.makedirs(base)
+    os.symlink(".", os.path.join(base, "p"))
+    os.symlink("../esc", os.path.join(base, "q"))
+
+    members = [tarfile.TarInfo(name="p/q/evil"), tarfile.TarInfo(name="model.pth")]
+    safe_members = [file_info.name for file_info in _repack_model._get_safe_members(members, base)]
+    assert safe_members == ["model.pth"]
+
+
+def test_extract_model_archive_into_model_dir_without_symlinks(tmp, monkeypatch):
+    files = ["model-%d.pth" % i for i in range(100)]
+    create_file_tree(os.path.join(tmp, "model"), files)
+    model_tar_location = os.path.join(tmp, "model.tar.gz")
+    with tarfile.open(model_tar_location, mode="w:gz") as t:
+        t.add(os.path.join(tmp, "model"), arcname=".")
+
+    # repack creates the code directory before extracting the model archive
+    model_dir = os.path.join(tmp, "opt", "ml", "model")
+    os.makedirs(os.path.join(model_dir, "code"))
+
+    realpath_calls = []
+
+    def realpath(path):
+        realpath_calls.append(path)
+        return os.path.realpath(path)
+
+    monkeypatch.setattr(_repack_model, "_HAS_DATA_FILTER", False)
+    monkeypatch.setattr(_repack_model, "realpath", realpath)
+    _repack_model._extract_model_archive(model_tar_location, model_dir)
+
+    # only the model directory itself is resolved
+    assert realpath_calls == [model_dir]
+    for file in files:
+        assert os.path.isfile(os.path.join(model_dir, file))
+
+
 def create_file_tree(root, tree):
     for file in tree:
         try: